@@ -1,26 +1,38 @@
+import os
+import threading
 import streamlit as st
-from models.llama_wrapper import LlamaChat
-from memory.embedder import Embedder
-from memory.memory_store import MemoryStore
 from memory.logger import JSONLogger
-from utils.prompt_builder import build_prompt
+from utils.prompt_builder import build_prompt, build_system_prefix
 from utils.time_utils import get_time_based_greeting
 from utils.chat_log_utils import load_sessions, get_session_summaries
-from utils.type_response_util import type_response
 
 st.set_page_config(page_title="Jarvis", layout="wide")
 
+system_prompt = "You are Jarvis, a helpful, intelligent AI assistant. Always refer to yourself as 'Jarvis' when speaking with the user. The user prefers to be addressed only as 'Sir' — never use their real name, even if provided. Be concise, respectful, and professional in all responses. Provide accurate information based on the user's queries. If you don't know the answer, say 'I don't know, Sir'. Do not make up information."
+
+# Heavy modules (llama_cpp, sentence-transformers, chromadb) are imported inside the
+# cached loaders, so they are only loaded once and never on the path of a page rerun
+
 @st.cache_resource
 def load_llama():
-    return LlamaChat(model_path="./models/openhermes-2.5-mistral-7b.Q4_K_M.gguf")
+    from models.llama_wrapper import get_llama
+    llama = get_llama("./models/openhermes-2.5-mistral-7b.Q4_K_M.gguf")
+    llama.cache_prefix(build_system_prefix(system_prompt))
+    threading.Thread(target=llama.warmup, daemon=True).start()
+    return llama
 
 @st.cache_resource
 def load_embedder():
-    return Embedder()
+    from memory.embedder import Embedder
+    embedder = Embedder()
+    threading.Thread(target=embedder.warmup, daemon=True).start()
+    return embedder
 
 @st.cache_resource
 def load_memory():
-    return MemoryStore()
+    from memory.memory_store import get_memory_store
+    # Same VECTOR_INDEX setting as main.py; empty means ChromaDB's own query()
+    return get_memory_store(vector_index=os.environ.get("VECTOR_INDEX", "matrix") or None)
 
 @st.cache_resource
 def load_logger():
@@ -32,8 +44,6 @@ memory = load_memory()
 logger = load_logger()
 
 
-system_prompt = "You are Jarvis, a helpful, intelligent AI assistant. Always refer to yourself as 'Jarvis' when speaking with the user. The user prefers to be addressed only as 'Sir' — never use their real name, even if provided. Be concise, respectful, and professional in all responses. Provide accurate information based on the user's queries. If you don't know the answer, say 'I don't know, Sir'. Do not make up information."
-
 # Load Sessions
 sessions = load_sessions()
 session_summaries = get_session_summaries(sessions)
@@ -89,14 +99,12 @@ if user_input:
     assistant_msg = st.chat_message("assistant")
 
     query_embed = embedder.get_embedding(user_input)
-    relevant = memory.retrieve(query_embed)
-    prompt = build_prompt(system_prompt, relevant, user_input)
+    relevant = memory.retrieve(query_embed) if not memory.is_empty() else []
+    prompt = build_prompt(system_prompt, relevant, [], user_input)
 
-    with st.spinner("Jarvis is thinking..."):
-        response = llama.generate(prompt)
+    # Render tokens as they arrive; write_stream returns the full reply for logging
+    response = assistant_msg.write_stream(llama.stream(prompt)).strip()
 
     st.session_state.chat_history.append({"role": "assistant", "content": response})
     logger.log(user_input, response)
-    memory.store(user_input, response, query_embed)
-
-    type_response(response)
\ No newline at end of file
+    memory.store(f"User: {user_input}\nJarvis: {response}", query_embed, {})
\ No newline at end of file
@@ -11,11 +11,36 @@ This module provides a robust hybrid retrieval system using:
     - Reciprocal Rank Fusion to combine heterogeneous results
 """
 
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
 from memory.embedder import Embedder
-from memory.memory_store import MemoryStore
+from memory.memory_store import MemoryStore, get_memory_store
+from utils.content_id import content_id
 from elasticsearch import Elasticsearch, exceptions as es_exceptions
-from elasticsearch.helpers import bulk
-from typing import List, Dict, Any
+from elasticsearch.helpers import bulk, parallel_bulk
+from typing import List, Dict, Any, Optional, Iterator
+
+# Background summary indexing: documents are sent in batches of at most
+# SUMMARY_CHUNK_SIZE, or whatever has accumulated after SUMMARY_FLUSH_INTERVAL seconds.
+SUMMARY_CHUNK_SIZE = 50
+SUMMARY_FLUSH_INTERVAL = 2.0
+
+# Number of ChromaDB documents fetched per page while rebuilding the BM25 index
+REBUILD_PAGE_SIZE = 1000
+
+# Bit assigned to each retriever when tracking which methods found a document,
+# and the decoded retrieval_methods for every possible mask
+METHOD_BITS = {"dense": 1, "bm25": 2}
+METHODS_BY_MASK = tuple(
+    tuple(name for name, bit in METHOD_BITS.items() if mask & bit)
+    for mask in range(1 << len(METHOD_BITS))
+)
 
 
 class HybridRetrievalPipeline:
@@ -26,21 +51,40 @@ class HybridRetrievalPipeline:
     using Reciprocal Rank Fusion for robust hybrid retrieval.
     """
 
-    def __init__(self, es_client: Elasticsearch, top_k: int = 50) -> None:
+    def __init__(
+        self,
+        es_client: Elasticsearch,
+        top_k: int = 50,
+        embedder: Optional[Embedder] = None,
+        memory: Optional[MemoryStore] = None
+    ) -> None:
         """
         Initialize the Hybrid Retrieval Pipeline.
 
         Args:
             es_client (Elasticsearch): An initialized Elasticsearch client.
             top_k (int, optional): Number of candidates to retrieve for each retriever. Defaults to 50.
+            embedder (Embedder, optional): Shared embedder instance. A new one is loaded if omitted.
+            memory (MemoryStore, optional): Dense store to search. Defaults to the "documents" collection.
         """
-        self.embedder = Embedder()
-        self.memory = MemoryStore(collection_name="documents")
+        self.embedder = embedder or Embedder()
+        self.memory = memory or get_memory_store(collection_name="documents")
         self.es = es_client
         self.top_k = top_k
 
+        # Cached "BM25 index has no documents"; None means it must be re-checked
+        self._bm25_empty: Optional[bool] = None
+
         self._ensure_index()
 
+        # Dense (Chroma) and BM25 (Elasticsearch) lookups are independent and I/O bound,
+        # so they run side by side for each query
+        self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid-search")
+
+        self._index_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._indexer = threading.Thread(target=self._drain_index_queue, daemon=True)
+        self._indexer.start()
+
     def _ensure_index(self) -> None:
         """
         Ensure that the Elasticsearch index for summaries exists.
@@ -64,10 +108,17 @@ class HybridRetrievalPipeline:
             self.es.indices.create(
                 index=index_name,
                 body={
+                    # Summaries are append-mostly and not needed within the same second,
+                    # so trade refresh latency and translog fsyncs for cheaper writes.
+                    "settings": {
+                        "refresh_interval": "30s",
+                        "translog": {"durability": "async"}
+                    },
                     "mappings": {
                         "properties": {
                             "text": {"type": "text"},
-                            "metadata": {"type": "object"}
+                            "metadata": {"type": "object"},
+                            "doc_id": {"type": "long"}
                         }
                     }
                 }
@@ -94,24 +145,104 @@ class HybridRetrievalPipeline:
 
         self._ensure_index()
 
-        results = self.memory.collection.get()
-        documents = results.get("documents", [])
-        metadatas = results.get("metadatas", [])
-
-        if not documents:
+        self.memory.flush()
+        if self.memory.collection.count() == 0:
             print("No documents found in ChromaDB for indexing.")
             return
 
-        actions = [
-            {
-                "_index": index_name,
-                "_source": {"text": doc, "metadata": meta}
-            }
-            for doc, meta in zip(documents, metadatas)
-        ]
-
-        success, _ = bulk(self.es, actions)
+        def gen_actions() -> Iterator[Dict[str, Any]]:
+            # Page through ChromaDB so only one page of documents is held in memory
+            offset = 0
+            while True:
+                page = self.memory.collection.get(
+                    include=["documents", "metadatas"], limit=REBUILD_PAGE_SIZE, offset=offset
+                )
+                documents = page.get("documents") or []
+                if not documents:
+                    return
+                for doc, meta in zip(documents, page.get("metadatas") or []):
+                    yield {
+                        "_index": index_name,
+                        "_source": {
+                            "text": doc,
+                            "metadata": meta,
+                            "doc_id": (meta or {}).get("doc_id") or content_id(doc)
+                        }
+                    }
+                offset += len(documents)
+
+        success = 0
+        for ok, item in parallel_bulk(
+            self.es,
+            gen_actions(),
+            chunk_size=500,
+            max_chunk_bytes=10 * 1024 * 1024,
+            thread_count=8,
+            queue_size=4,
+            raise_on_error=False
+        ):
+            if ok:
+                success += 1
+            else:
+                print(f"Failed to index document: {item}")
         print(f"Successfully indexed {success} documents into Elasticsearch.")
+        self._bm25_empty = None
+
+    def index_summary(self, text: str, metadata: Dict[str, Any]) -> None:
+        """
+        Queue a session summary for BM25 indexing.
+
+        The document is written by a background thread in batches, so this
+        call never blocks on an Elasticsearch round-trip.
+
+        Args:
+            text (str): Summary text.
+            metadata (Dict[str, Any]): Session metadata stored alongside the text.
+        """
+        self._bm25_empty = False
+        self._index_queue.put({
+            "_index": "summaries",
+            "_source": {"text": text, "metadata": metadata, "doc_id": content_id(text)}
+        })
+
+    def flush(self) -> None:
+        """
+        Block until every queued summary has been sent to Elasticsearch.
+        """
+        self._index_queue.join()
+
+    def _drain_index_queue(self) -> None:
+        """
+        Background worker that batches queued summaries into bulk requests.
+        """
+        while True:
+            batch = [self._index_queue.get()]
+            deadline = time.monotonic() + SUMMARY_FLUSH_INTERVAL
+
+            while len(batch) < SUMMARY_CHUNK_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._index_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                bulk(self.es, batch, chunk_size=SUMMARY_CHUNK_SIZE)
+            except Exception as e:
+                print(f"Error indexing summaries: {repr(e)}")
+            finally:
+                for _ in batch:
+                    self._index_queue.task_done()
+
+    def _bm25_is_empty(self) -> bool:
+        """
+        Check whether the BM25 index holds any documents, caching the answer between writes.
+        """
+        if self._bm25_empty is None:
+            self._bm25_empty = self.es.count(index="summaries")["count"] == 0
+        return self._bm25_empty
 
     def _bm25_search(self, query: str, top_k: int = 25) -> List[Dict[str, Any]]:
         """
@@ -143,6 +274,7 @@ class HybridRetrievalPipeline:
                 "text": hit["_source"]["text"],
                 "meta": hit["_source"]["metadata"],
                 "score": hit["_score"],
+                "doc_id": hit["_source"].get("doc_id"),
                 "retrieval_method": "bm25"
             }
             for hit in res["hits"]["hits"]
@@ -162,18 +294,33 @@ class HybridRetrievalPipeline:
         query_embedding = self.embedder.get_embedding(query)
         raw_results = self.memory.retrieve(query_embedding=query_embedding, top_k=top_k)
 
+        # MemoryStore already reports relevance_score (higher is better) on unit-length
+        # embeddings, so it is used directly instead of being re-derived from a distance
         return [
             {
-                "text": chunk["text"],
-                "meta": chunk["metadata"],
-                "score": 1.0 / (1.0 + chunk["score"]),
+                **chunk,
+                "text": chunk["content"],
+                "meta": {
+                    "session_id": chunk["session_id"],
+                    "timestamp": chunk["timestamp"],
+                    "message_count": chunk["message_count"]
+                },
+                "score": chunk["relevance_score"],
                 "retrieval_method": "dense"
             }
             for chunk in raw_results
         ]
 
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _rrf_weights(k: int, length: int) -> np.ndarray:
+        """
+        Precompute the RRF contribution 1 / (k + rank + 1) for ranks 0..length-1.
+        """
+        return 1.0 / (k + np.arange(length, dtype=np.float64) + 1)
+
     def reciprocal_rank_fusion(
-        self, result_lists: List[List[Dict[str, Any]]], k: int = 60
+        self, result_lists: List[List[Dict[str, Any]]], k: int = 60, final_k: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         Combine multiple result lists using Reciprocal Rank Fusion (RRF).
@@ -181,36 +328,43 @@ class HybridRetrievalPipeline:
         Args:
             result_lists (List[List[Dict[str, Any]]]): Lists of ranked results to fuse.
             k (int, optional): RRF constant. Defaults to 60.
+            final_k (int, optional): Only materialize this many top results. Defaults to all.
 
         Returns:
             List[Dict[str, Any]]: Fused and re-ranked list.
         """
-        fused_scores = {}
+        # Intern each distinct document to a small integer slot. Content ids are computed
+        # once at ingestion, so hashing only happens here for documents indexed without one.
+        slots: Dict[int, int] = {}
+        docs: List[Dict[str, Any]] = []
+        masks: List[int] = []
+        scores = np.zeros(sum(len(result_list) for result_list in result_lists))
+        weights = self._rrf_weights(k, max((len(result_list) for result_list in result_lists), default=0))
 
         for result_list in result_lists:
             for rank, doc in enumerate(result_list):
-                doc_id = hash(doc["text"])
-                if doc_id not in fused_scores:
-                    fused_scores[doc_id] = {
-                        "doc": doc,
-                        "score": 0.0,
-                        "methods": []
-                    }
-                fused_scores[doc_id]["score"] += 1.0 / (k + rank + 1)
-                fused_scores[doc_id]["methods"].append(doc["retrieval_method"])
+                doc_id = doc.get("doc_id") or content_id(doc["text"])
+                slot = slots.get(doc_id)
+                if slot is None:
+                    slot = slots[doc_id] = len(docs)
+                    docs.append(doc)
+                    masks.append(0)
+                scores[slot] += weights[rank]
+                masks[slot] |= METHOD_BITS.get(doc["retrieval_method"], 0)
+
+        # Stable sort keeps first-seen order for ties, matching sorted(..., reverse=True)
+        order = np.argsort(-scores[:len(docs)], kind="stable")[:final_k]
 
-        fused = [
+        return [
             {
-                **item["doc"],
-                "rrf_score": item["score"],
-                "retrieval_methods": list(set(item["methods"])),
-                "score": item["score"],
+                **docs[slot],
+                "rrf_score": float(scores[slot]),
+                "retrieval_methods": list(METHODS_BY_MASK[masks[slot]]),
+                "score": float(scores[slot]),
             }
-            for item in sorted(fused_scores.values(), key=lambda x: x["score"], reverse=True)
+            for slot in order
         ]
 
-        return fused
-
     def retrieve(self, query: str, final_k: int = 10) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents using hybrid BM25 + Dense + RRF.
@@ -222,14 +376,19 @@ class HybridRetrievalPipeline:
         Returns:
             List[Dict[str, Any]]: Ranked list of relevant documents.
         """
-        dense_results = self._dense_search(query, top_k=self.top_k // 2)
-        bm25_results = self._bm25_search(query, top_k=self.top_k // 2)
+        # Cold memory: skip embedding the query and the Elasticsearch round-trip entirely
+        if self.memory.is_empty() and self._bm25_is_empty():
+            return []
+
+        dense_future = self._search_pool.submit(self._dense_search, query, self.top_k // 2)
+        bm25_future = self._search_pool.submit(self._bm25_search, query, self.top_k // 2)
+        dense_results, bm25_results = dense_future.result(), bm25_future.result()
 
         print(f"Dense results retrieved: {len(dense_results)}")
         print(f"BM25 results retrieved: {len(bm25_results)}")
 
         if dense_results and bm25_results:
-            fused_results = self.reciprocal_rank_fusion([dense_results, bm25_results])
+            fused_results = self.reciprocal_rank_fusion([dense_results, bm25_results], final_k=final_k)
         elif dense_results:
             fused_results = dense_results
         elif bm25_results:
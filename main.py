@@ -14,19 +14,18 @@ Behavior:
     - Never hallucinates or invents ungrounded context
 """
 
-from models.llama_wrapper import LlamaChat
-from memory.embedder import Embedder
-from memory.memory_store import MemoryStore
+import argparse
+import os
+import sys
+import threading
+
 from memory.logger import JSONLogger
 from memory.session_manager import SessionManager
-from utils.prompt_builder import build_prompt
+from utils.prompt_builder import build_prompt, build_system_prefix
+from utils.chat_log_utils import load_sessions
 from utils.time_utils import get_time_based_greeting
-from utils.estimate_tokens import estimate_tokens
 from utils.generate_summary import generate_session_summary
 
-from elasticsearch import Elasticsearch
-from hybrid_pipeline import HybridRetrievalPipeline
-
 
 # ======================
 # SYSTEM PROMPT
@@ -59,15 +58,46 @@ Your response must be:
 # INITIALIZATION
 # ======================
 
-llama = LlamaChat(model_path="./models/llama-3.1-8b-instruct-q4_k_m.gguf")
+parser = argparse.ArgumentParser(description="JARVIS AI Assistant")
+parser.add_argument(
+    "--warm-cache",
+    action="store_true",
+    help="embed every logged user message into the persistent embedding cache before starting"
+)
+args = parser.parse_args()
+
+# Heavy imports are deferred until the arguments are parsed, so --help returns instantly
+from models.llama_wrapper import get_llama
+from memory.embedder import Embedder
+from memory.memory_store import get_memory_store
+from elasticsearch import Elasticsearch
+from hybrid_pipeline import HybridRetrievalPipeline
+
+llama = get_llama("./models/llama-3.1-8b-instruct-q4_k_m.gguf")
+llama.cache_prefix(build_system_prefix(SYSTEM_PROMPT))
 embedder = Embedder()
-memory = MemoryStore()
+# VECTOR_INDEX picks the in-process index for retrieval: "matrix" (default), "matrix_int8" or "faiss";
+# set it empty to query ChromaDB's own HNSW index instead
+memory = get_memory_store(vector_index=os.environ.get("VECTOR_INDEX", "matrix") or None)
 logger = JSONLogger()
 session_manager = SessionManager()
 session_id = session_manager.get_or_create_session()
 
 es_client = Elasticsearch("http://localhost:9200")
-pipeline = HybridRetrievalPipeline(es_client=es_client, top_k=50)
+pipeline = HybridRetrievalPipeline(es_client=es_client, top_k=50, embedder=embedder, memory=memory)
+
+if args.warm_cache:
+    logged_queries = [
+        entry["user"]
+        for session in load_sessions(logger.file_path)
+        for entry in session
+        if entry["type"] == "message"
+    ]
+    print(f"Embedding cache warmed with {embedder.warm_cache(logged_queries)} logged queries.")
+
+# Warm both models in the background so the first turn does not pay their start-up cost
+threading.Thread(target=llama.warmup, daemon=True).start()
+threading.Thread(target=embedder.warmup, daemon=True).start()
 
 print("Jarvis AI Assistant - Initializing...")
 greeting = f"{get_time_based_greeting()}, Sir. JARVIS is online and ready to assist you."
@@ -75,6 +105,40 @@ print(f"JARVIS: {greeting}\n")
 logger.log("Session started", greeting)
 
 
+# ======================
+# SPECIAL COMMANDS
+# ======================
+
+def _cmd_reset():
+    memory.reset()
+    print("Memory banks cleared, Sir!")
+
+
+def _cmd_stats():
+    stats = memory.get_stats()
+    session_stats = session_manager.get_session_stats()
+    print(f"Memory Bank: {stats['total_summaries']} session summaries stored")
+    print(f"Current Session: {session_stats.get('message_count', 0)} messages, {session_stats.get('total_tokens', 0)} tokens")
+
+
+def _cmd_cleanup():
+    memory.cleanup_old_summaries(keep_recent=30)
+    print("Memory optimization complete, Sir!")
+
+
+def _cmd_rebuild_bm25():
+    pipeline.rebuild_bm25_index()
+    print("BM25 index rebuilt, Sir!")
+
+
+COMMANDS = {
+    "/reset": _cmd_reset,
+    "/stats": _cmd_stats,
+    "/cleanup": _cmd_cleanup,
+    "/rebuild-bm25": _cmd_rebuild_bm25,
+}
+
+
 # ======================
 # MAIN INTERACTION LOOP
 # ======================
@@ -86,26 +150,10 @@ try:
             continue
 
         # ---- SPECIAL COMMANDS ----
-        if user_input.lower() == "/reset":
-            memory.reset()
-            print("Memory banks cleared, Sir!")
-            continue
-
-        if user_input.lower() == "/stats":
-            stats = memory.get_stats()
-            session_stats = session_manager.get_session_stats()
-            print(f"Memory Bank: {stats['total_summaries']} session summaries stored")
-            print(f"Current Session: {session_stats.get('message_count', 0)} messages, {session_stats.get('total_tokens', 0)} tokens")
-            continue
-
-        if user_input.lower() == "/cleanup":
-            memory.cleanup_old_summaries(keep_recent=30)
-            print("Memory optimization complete, Sir!")
-            continue
-
-        if user_input.lower() == "/rebuild-bm25":
-            pipeline.rebuild_bm25_index()
-            print("BM25 index rebuilt, Sir!")
+        # Only inputs starting with "/" can be commands, so regular messages skip the lookup
+        handler = COMMANDS.get(user_input.lower()) if user_input.startswith("/") else None
+        if handler:
+            handler()
             continue
 
         # ---- SESSION CHECK ----
@@ -120,19 +168,18 @@ try:
                 # Store in ChromaDB (dense)
                 summary_embedding = embedder.get_embedding(session_summary)
                 memory.store(session_summary, summary_embedding, session_data)
+                memory.flush()
 
-                # Store in Elasticsearch (BM25)
-                es_client.index(
-                    index="summaries",
-                    document={"text": session_summary, "metadata": session_data}
-                )
+                # Store in Elasticsearch (BM25), written in the background
+                pipeline.index_summary(session_summary, session_data)
 
                 print("Session summary stored in ChromaDB + Elasticsearch, Sir!")
             else:
                 session_manager.end_session()
                 print("Session ended — no summary needed for empty session, Sir.")
 
-            # Start new session
+            # Start new session with a clean KV cache
+            llama.reset()
             session_id = session_manager.get_or_create_session()
             continue
 
@@ -140,22 +187,24 @@ try:
         relevant_summaries = pipeline.retrieve(user_input, final_k=5)
 
         # ---- CURRENT SESSION CONTEXT ----
-        current_session_context = session_manager.get_session_context()
+        session_messages = session_manager.get_session_messages()
 
         # ---- BUILD PROMPT ----
         prompt = build_prompt(
             SYSTEM_PROMPT,
             relevant_summaries,
-            current_session_context,
+            session_messages,
             user_input
         )
 
-        # ---- TOKEN ESTIMATION ----
-        estimated_tokens = estimate_tokens(prompt, llama)
-
         # ---- GENERATE RESPONSE ----
-        response = llama.generate(prompt)
-        print(f"JARVIS: {response}\n")
+        sys.stdout.write("JARVIS: ")
+        response = llama.generate(prompt)  # echoes tokens as they stream in
+        sys.stdout.write("\n\n")
+
+        # ---- TOKEN COUNT ----
+        # The prompt was already tokenized for generation, so reuse that count
+        estimated_tokens = llama.last_prompt_tokens
 
         # ---- LOG & SAVE ----
         logger.log(user_input, response)
@@ -171,10 +220,9 @@ except KeyboardInterrupt:
             session_data = session_manager.end_session(session_summary)
             summary_embedding = embedder.get_embedding(session_summary)
             memory.store(session_summary, summary_embedding, session_data)
-            es_client.index(
-                index="summaries",
-                document={"text": session_summary, "metadata": session_data}
-            )
+            memory.flush()
+            pipeline.index_summary(session_summary, session_data)
+            pipeline.flush()
             print("Emergency session save complete, Sir!")
     except Exception as e:
         print(f"Could not save session data, Sir. Reason: {e}")
@@ -182,6 +230,9 @@ except KeyboardInterrupt:
     logger.log_session_end()
 
 finally:
+    # Make sure queued summaries reach Elasticsearch before exiting
+    pipeline.flush()
+    session_manager.close()
     if 'llama' in locals():
         del llama
     print("Resources cleaned up, Sir. Goodbye.")
@@ -1,8 +1,104 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+# Process-wide query embedding cache shared by every Embedder instance.
+# Keys are SHA-256 digests of (model_name, text); values are float32 bytes.
+_CACHE_MAXSIZE = 4096
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
 class Embedder:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
+    def __init__(self, model_name="all-MiniLM-L6-v2", cache_path="embed_cache.sqlite"):
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
 
+        # Durable cache so embeddings survive restarts; None disables it
+        self._db = None
+        self._db_lock = threading.Lock()
+        if cache_path:
+            self._db = sqlite3.connect(cache_path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (hash BLOB PRIMARY KEY, vec BLOB)")
+
+    def _cache_get(self, key: bytes):
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached is not None:
+                _cache.move_to_end(key)
+                return cached
+
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT vec FROM cache WHERE hash = ?", (key[:16],)).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def _remember(self, key: bytes, blob: bytes) -> None:
+        with _cache_lock:
+            _cache[key] = blob
+            _cache.move_to_end(key)
+            if len(_cache) > _CACHE_MAXSIZE:
+                _cache.popitem(last=False)
+
+    def _cache_put(self, key: bytes, vector) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        self._remember(key, blob)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR IGNORE INTO cache (hash, vec) VALUES (?, ?)", (key[:16], blob))
+
+    def warmup(self):
+        """Run one throwaway forward pass so the first real query skips model initialization"""
+        self.model.encode(["warmup"])
+
     def get_embedding(self, text: str):
-        return self.model.encode([text])[0].tolist()
+        key = _cache_key(self.model_name, text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32).tolist()
+
+        vector = self.model.encode([text], normalize_embeddings=True)[0]
+        self._cache_put(key, vector)
+        return vector.tolist()
+
+    def get_embeddings(self, texts):
+        """Embed several texts, running a single batched forward pass for cache misses"""
+        keys = [_cache_key(self.model_name, text) for text in texts]
+        results = [None] * len(texts)
+        misses = []
+
+        for i, key in enumerate(keys):
+            cached = self._cache_get(key)
+            if cached is not None:
+                results[i] = np.frombuffer(cached, dtype=np.float32).tolist()
+            else:
+                misses.append(i)
+
+        if misses:
+            vectors = self.model.encode([texts[i] for i in misses], normalize_embeddings=True)
+            for i, vector in zip(misses, vectors):
+                self._cache_put(keys[i], vector)
+                results[i] = vector.tolist()
+
+        return results
+
+    def warm_cache(self, texts, batch_size=64) -> int:
+        """Embed texts in batches so later lookups are cache hits; returns how many were processed"""
+        unique = list(dict.fromkeys(text for text in texts if text))
+        for start in range(0, len(unique), batch_size):
+            self.get_embeddings(unique[start:start + batch_size])
+        return len(unique)
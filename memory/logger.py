@@ -1,43 +1,42 @@
-import json
-import os
+import orjson
 import time
 class JSONLogger:
-    def __init__(self, file_path="chat_log.json"):
+    """Append-only chat logger writing one JSON object per line (JSON Lines)."""
+    def __init__(self, file_path="chat_log.jsonl"):
         self.file_path = file_path
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, "w") as f:
-                json.dump([], f)  # Initialize empty list
+        self._ts_second = None
+        self._ts_text = None
+
+    def _timestamp(self):
+        """Local time string, formatted at most once per second"""
+        now = int(time.time())
+        if now != self._ts_second:
+            self._ts_second = now
+            self._ts_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        return self._ts_text
+
+    def _append(self, entry):
+        with open(self.file_path, "ab") as f:
+            f.write(orjson.dumps(entry) + b"\n")
 
     def log(self, user_msg, assistant_msg):
         entry = {
             "user": user_msg,
             "assistant": assistant_msg,
-            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            "time": self._timestamp()
         }
-        with open(self.file_path, "r+") as f:
-            data = json.load(f)
-            data.append(entry)
-            f.seek(0)
-            json.dump(data, f, indent=2)
+        self._append(entry)
 
     def log_session_start(self):
         entry = {
             "event": "session_start",
-            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            "time": self._timestamp()
         }
-        with open(self.file_path, "r+") as f:
-            data = json.load(f)
-            data.append(entry)
-            f.seek(0)
-            json.dump(data, f, indent=2)
+        self._append(entry)
 
     def log_session_end(self):
         entry = {
             "event": "session_end",
-            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            "time": self._timestamp()
         }
-        with open(self.file_path, "r+") as f:
-            data = json.load(f)
-            data.append(entry)
-            f.seek(0)
-            json.dump(data, f, indent=2)
\ No newline at end of file
+        self._append(entry)
@@ -1,77 +1,348 @@
+import atexit
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
 import time
+
+# Opt out of Chroma's telemetry before import so its client is never initialized
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
 import chromadb
+import numpy as np
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Callable, Optional
+from utils.content_id import content_id
+from memory.vector_index import FaissIndex, MatrixIndex, normalize
+
+# HNSW settings for new collections, sized for a few thousand summaries.
+# Chroma fixes these when a collection is created; existing collections keep theirs.
+HNSW_CONFIG = {"hnsw:space": "cosine", "hnsw:construction_ef": 100, "hnsw:search_ef": 64, "hnsw:M": 16}
+
+# One MemoryStore per (persist_dir, collection_name) for the whole process
+_stores: Dict[Tuple[str, str], "MemoryStore"] = {}
+_stores_lock = threading.Lock()
+
+def _iso_timestamp(value) -> str:
+    """Render a session time as the ISO string stored in Chroma metadata; SQLite keeps epoch seconds."""
+    if value is None:
+        return datetime.now().isoformat()
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).isoformat()
+    return value
+
+class WriteBuffer:
+    """Collects pending inserts and writes them to a Chroma collection in one add() call.
+
+    A flush happens once `max_items` entries are pending or `flush_interval` seconds
+    after the first pending entry, whichever comes first. Pending entries stay
+    searchable through `search()` until they are flushed. `on_flush`, if given, is
+    called with the ids, embeddings and metadatas of every batch that reached the collection.
+    """
+    def __init__(self, collection, max_items: int = 64, flush_interval: float = 5.0,
+                 on_flush: Optional[Callable[[List[str], List[np.ndarray], List[Dict[str, Any]]], None]] = None):
+        self.collection = collection
+        self.on_flush = on_flush
+        self.max_items = max_items
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._timer = None
+        self._clear_pending()
+
+    def _clear_pending(self):
+        self._ids = []
+        self._documents = []
+        self._embeddings = []
+        self._metadatas = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def append(self, doc_id: str, document: str, embedding, metadata: Dict[str, Any]):
+        with self._lock:
+            if doc_id in self._ids:
+                return  # Same semantics as collection.add(): the first write wins
+            self._ids.append(doc_id)
+            self._documents.append(document)
+            self._embeddings.append(np.asarray(embedding, dtype=np.float32))
+            self._metadatas.append(metadata)
+
+            if len(self._ids) >= self.max_items:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write every pending entry to the collection."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._ids:
+                return
+            try:
+                self.collection.add(
+                    documents = self._documents,
+                    embeddings = [embedding.tolist() for embedding in self._embeddings],
+                    ids = self._ids,
+                    metadatas = self._metadatas
+                )
+            except Exception as e:
+                print(f"Error flushing memory write buffer: {e}")
+                return
+            if self.on_flush is not None:
+                self.on_flush(self._ids, self._embeddings, self._metadatas)
+            self._clear_pending()
+
+    def clear(self):
+        """Drop pending entries without writing them."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._clear_pending()
+
+    def search(self, query_embedding, top_k: int) -> List[Tuple[str, Dict[str, Any], float]]:
+        """Brute-force search over pending unit-length entries, returning cosine similarities."""
+        with self._lock:
+            if not self._ids:
+                return []
+            matrix = np.vstack(self._embeddings)
+            similarities = matrix @ np.asarray(query_embedding, dtype=np.float32)
+            order = np.argsort(-similarities)[:top_k]
+            return [(self._documents[i], self._metadatas[i], float(similarities[i])) for i in order]
 
 class MemoryStore:
-    def __init__(self, persist_dir="./chroma_store", collection_name="session_summaries"):
+    def __init__(self, persist_dir="./chroma_store", collection_name="session_summaries", vector_index=None):
+        """
+        vector_index selects an optional in-process index used for retrieval instead of
+        Chroma's query(): "faiss" (HNSW, needs the faiss package), "matrix" (exact
+        dot product over a contiguous NumPy matrix) or "matrix_int8" (the same matrix
+        stored as int8). ChromaDB remains the system of record.
+        """
         self.collection_name = collection_name
         self.client = chromadb.PersistentClient(path=persist_dir)
-        self.collection = self.client.get_or_create_collection(name=collection_name)
+        self._open_collection()
+
+        self._index = None
+        if vector_index == "faiss":
+            self._index = FaissIndex(os.path.join(persist_dir, f"{collection_name}.faiss"))
+        elif vector_index in ("matrix", "matrix_int8"):
+            self._index = MatrixIndex(quantize=vector_index == "matrix_int8")
+        elif vector_index is not None:
+            raise ValueError(f"Unknown vector_index: {vector_index}")
+        if self._index is not None and len(self._index) != self.collection.count():
+            self._rebuild_index()
+
+        # Number of summaries in ChromaDB, kept up to date locally by flush/delete/reset
+        self._count = self.collection.count()
+
+        # Side table of (id, timestamp) so "most recent N" is an ORDER BY ... LIMIT in SQLite
+        # instead of fetching and sorting every summary's metadata from Chroma
+        self._order_lock = threading.Lock()
+        self._order_db = sqlite3.connect(
+            os.path.join(persist_dir, "summary_index.sqlite"), isolation_level=None, check_same_thread=False
+        )
+        self._order_db.execute("PRAGMA journal_mode=WAL")
+        self._order_db.execute("PRAGMA synchronous=NORMAL")
+        self._order_db.execute(
+            "CREATE TABLE IF NOT EXISTS summary_index ("
+            "collection TEXT, chroma_id TEXT, timestamp TEXT, PRIMARY KEY (collection, chroma_id))"
+        )
+        self._order_db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_summary_index_time ON summary_index(collection, timestamp)"
+        )
+        indexed = self._order_db.execute(
+            "SELECT COUNT(*) FROM summary_index WHERE collection = ?", (self.collection_name,)
+        ).fetchone()[0]
+        if indexed != self._count:
+            self._rebuild_order_index()
+
+        self._buffer = WriteBuffer(self.collection, on_flush=self._on_flush)
+        atexit.register(self.close)
+
+    def _open_collection(self):
+        # HNSW_CONFIG only applies on creation; older chromadb releases would otherwise
+        # overwrite an existing collection's metadata without changing its index
+        try:
+            self.collection = self.client.get_collection(name=self.collection_name)
+        except Exception:  # The "does not exist" error type differs across chromadb releases
+            self.collection = self.client.create_collection(name=self.collection_name, metadata=HNSW_CONFIG)
+        # Collections created before HNSW_CONFIG existed still use Chroma's default l2 space
+        self._space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def _similarity(self, distance: float) -> float:
+        """Convert this collection's distance between unit vectors into cosine similarity."""
+        if self._space == "l2":
+            return 1.0 - distance / 2.0  # squared L2 = 2 - 2 * cosine
+        return 1.0 - distance  # cosine and ip
+
+    def _on_flush(self, ids, embeddings, metadatas):
+        self._count += len(ids)
+        if self._index is not None:
+            self._index.add(ids, embeddings)
+        self._index_order(ids, metadatas)
+
+    def _index_order(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._order_lock:
+            self._order_db.executemany(
+                "INSERT OR REPLACE INTO summary_index (collection, chroma_id, timestamp) VALUES (?, ?, ?)",
+                [(self.collection_name, doc_id, (metadata or {}).get("timestamp", "")) for doc_id, metadata in zip(ids, metadatas)]
+            )
+
+    def _unindex_order(self, ids: List[str]):
+        with self._order_lock:
+            self._order_db.executemany(
+                "DELETE FROM summary_index WHERE collection = ? AND chroma_id = ?",
+                [(self.collection_name, doc_id) for doc_id in ids]
+            )
+
+    def _rebuild_order_index(self):
+        """Repopulate the timestamp side table from ChromaDB metadata."""
+        with self._order_lock:
+            self._order_db.execute("DELETE FROM summary_index WHERE collection = ?", (self.collection_name,))
+        results = self.collection.get(include=["metadatas"])
+        self._index_order(results["ids"], results["metadatas"] or [])
+
+    def _ids_by_recency(self, limit: int = -1, offset: int = 0) -> List[str]:
+        """Chroma ids ordered newest first; limit=-1 means no limit."""
+        with self._order_lock:
+            rows = self._order_db.execute(
+                "SELECT chroma_id FROM summary_index WHERE collection = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                (self.collection_name, limit, offset)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_empty(self) -> bool:
+        """True when nothing is stored or buffered, without querying ChromaDB."""
+        return self._count == 0 and len(self._buffer) == 0
+
+    def flush(self):
+        """Write any buffered summaries to ChromaDB."""
+        self._buffer.flush()
+
+    def close(self):
+        """Flush pending writes and persist the vector index, if enabled."""
+        self.flush()
+        if self._index is not None:
+            self._index.save()
+
+    def _rebuild_index(self):
+        """Reload every stored embedding from ChromaDB into the vector index."""
+        if self._index is None:
+            return
+        results = self.collection.get(include=["embeddings"])
+        self._index.rebuild(results["ids"], results["embeddings"] if results["ids"] else [])
+
+    @staticmethod
+    def _to_summary(document: str, metadata: Dict[str, Any], similarity: float) -> Dict[str, Any]:
+        return {
+            "content": document.strip(),
+            # 1 - squared L2 between unit vectors, the scale the prompt's relevance cutoff was tuned on,
+            # kept the same whatever distance space the collection uses
+            "relevance_score": 2.0 * similarity - 1.0,
+            "session_id": metadata.get("session_id", "unknown"),
+            "timestamp": metadata.get("timestamp", ""),
+            "message_count": metadata.get("message_count", 0),
+            "doc_id": metadata.get("doc_id")
+        }
 
     def store(self, summary: str, embedding, session_data : Dict[str, Any]):
         """Store a summarized memory or factual preference."""
+        doc_id, metadata = self._prepare(summary, session_data)
+        self._buffer.append(doc_id, summary, normalize(embedding), metadata)
+
+    @staticmethod
+    def _prepare(summary: str, session_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Build the Chroma id and metadata for a summary."""
         metadata = {
             "session_id": session_data.get("session_id", "unknown"),
-            "timestamp": session_data.get("end_time", datetime.now().isoformat()),
-            "message_count": session_data.get("message_count", 0)
+            "timestamp": _iso_timestamp(session_data.get("end_time")),
+            "message_count": session_data.get("message_count", 0),
+            "doc_id": content_id(summary)
         }
         session_id = session_data.get("session_id", int(time.time() * 1000000))
-        doc_id = f"summary_{session_id}"
-        self.collection.add(
-            documents = [summary],
-            embeddings = [embedding],
-            ids = [doc_id],
-            metadatas = [metadata]
-        )
+        return f"summary_{session_id}", metadata
+
+    def _retrieve_indexed(self, query_embedding, top_k: int) -> List[Dict[str, Any]]:
+        """Look up nearest ids in the vector index, then fetch their documents from ChromaDB."""
+        hits = self._index.search(query_embedding, top_k)
+        if not hits:
+            return []
+        results = self.collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+        rows = {
+            doc_id: (document, metadata or {})
+            for doc_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+        return [
+            self._to_summary(rows[doc_id][0], rows[doc_id][1], similarity)
+            for doc_id, similarity in hits
+            if doc_id in rows
+        ]
 
     def retrieve(self, query_embedding, top_k=10):
         """Retrieve session summaries based on query embedding"""
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
-        )    
-        summaries = []
-        if results["documents"] and results["documents"][0]:
-            for i, summary in enumerate(results["documents"][0]):
-                metadata = results["metadatas"][0][i] if results["metadatas"] and results["metadatas"][0] else {}
-                distance = results["distances"][0][i] if results["distances"][0] else 1.0
+        query_embedding = normalize(query_embedding)
+        if self._index is not None:
+            summaries = self._retrieve_indexed(query_embedding, top_k)
+        else:
+            results = self.collection.query(
+                query_embeddings=[query_embedding.tolist()],
+                n_results=top_k,
+                include=["documents", "metadatas", "distances"]
+            )    
+            documents = results["documents"][0] if results["documents"] else []
+            metadatas = results["metadatas"][0] if results["metadatas"] and results["metadatas"][0] else [{}] * len(documents)
+            distances = results["distances"][0] if results["distances"] and results["distances"][0] else [1.0] * len(documents)
+            summaries = [
+                self._to_summary(summary, metadata, self._similarity(distance))
+                for summary, metadata, distance in zip(documents, metadatas, distances)
+            ]
 
-                summaries.append({
-                    "content": summary.strip(),
-                    "relevance_score": 1.0 - distance,
-                    "session_id": metadata.get("session_id", "unknown"),
-                    "timestamp": metadata.get("timestamp", ""),
-                    "message_count": metadata.get("message_count", 0)
-                })
-        summaries.sort(key=lambda x: x["relevance_score"], reverse=True)
-        return summaries
+        # Include summaries that are still waiting in the write buffer
+        buffered = [
+            self._to_summary(summary, metadata, similarity)
+            for summary, metadata, similarity in self._buffer.search(query_embedding, top_k)
+        ]
+        if not buffered:
+            # Chroma and the vector index already return hits nearest first
+            return summaries
+        # Both lists are sorted by relevance, so a linear merge keeps the order without re-sorting
+        merged = heapq.merge(summaries, buffered, key=lambda x: x["relevance_score"], reverse=True)
+        return list(itertools.islice(merged, top_k))
 
     def retrieve_recent_summaries(self, limit: int = 3) -> List[Dict[str, Any]]:
         """Retrieve most recent session summaries."""
+        self.flush()
         try:
+            recent_ids = self._ids_by_recency(limit=limit)
+            if not recent_ids:
+                return []
+
+            # Fetch only those summaries, then restore the recency order from SQLite
             results = self.collection.get(
+                ids=recent_ids,
                 include=["documents", "metadatas"]
             )
-            
-            if not results["documents"]:
-                return []
-            
-            # Combine documents with minimal metadata and sort by timestamp
+            rows = {
+                doc_id: (doc, metadata or {})
+                for doc_id, doc, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+            }
+
             summaries = []
-            for i, doc in enumerate(results["documents"]):
-                metadata = results["metadatas"][i] if results["metadatas"] else {}
+            for doc_id in recent_ids:
+                if doc_id not in rows:
+                    continue
+                doc, metadata = rows[doc_id]
                 summaries.append({
                     "content": doc,
                     "session_id": metadata.get("session_id", "unknown"),
                     "timestamp": metadata.get("timestamp", ""),
                     "message_count": metadata.get("message_count", 0)
                 })
-            
-            # Sort by timestamp (most recent first)
-            summaries.sort(key=lambda x: x["timestamp"], reverse=True)
-            return summaries[:limit]
+            return summaries
             
         except Exception as e:
             print(f"Error retrieving recent summaries: {e}")
@@ -79,49 +350,52 @@ class MemoryStore:
 
     def get_stats(self) -> Dict[str, int]:
         """Get statistics about stored session summaries."""
-        try:
-            all_data = self.collection.get(include=["metadatas"])
-            
-            total_summaries = len(all_data["metadatas"]) if all_data["metadatas"] else 0
-            
-            return {
-                "total_summaries": total_summaries
-            }
-        except Exception as e:
-            print(f"Error getting stats: {e}")
-            return {"total_summaries": 0}
+        return {
+            "total_summaries": self._count + len(self._buffer)
+        }
 
     def reset(self):
         """Reset the memory store by deleting and recreating the collection."""
         try:
+            self._buffer.clear()
             self.client.delete_collection(self.collection_name)
-            self.collection = self.client.get_or_create_collection(name=self.collection_name)
+            self._open_collection()
+            self._buffer.collection = self.collection
+            self._count = 0
+            self._rebuild_index()
+            self._rebuild_order_index()
             print("Session summary memory store reset successfully")
         except Exception as e:
             print(f"Error resetting memory store: {e}")
 
     def cleanup_old_summaries(self, keep_recent: int = 50):
         """Keep only recent session summaries."""
+        self.flush()
         try:
-            # Get all summaries
-            results = self.collection.get(
-                include=["metadatas", "ids"]
-            )
-            
-            if not results["ids"] or len(results["ids"]) <= keep_recent:
+            if self._count <= keep_recent:
                 return
             
-            # Sort by timestamp and get IDs of old summaries to delete
-            summaries = list(zip(results["ids"], results["metadatas"]))
-            summaries.sort(key=lambda x: x[1].get("timestamp", ""), reverse=True)
-            
-            # Get IDs of summaries to delete (keep only recent ones)
-            old_summaries = summaries[keep_recent:]
-            ids_to_delete = [summary_id for summary_id, _ in old_summaries]
+            # Everything past the newest keep_recent summaries, straight from the SQLite side table
+            ids_to_delete = self._ids_by_recency(offset=keep_recent)
             
             if ids_to_delete:
                 self.collection.delete(ids=ids_to_delete)
+                self._unindex_order(ids_to_delete)
+                self._count -= len(ids_to_delete)
+                self._rebuild_index()
                 print(f"Cleaned up {len(ids_to_delete)} old session summaries")
                 
         except Exception as e:
             print(f"Error during cleanup: {e}")
+
+def get_memory_store(persist_dir="./chroma_store", collection_name="session_summaries", vector_index=None) -> MemoryStore:
+    """Return the process-wide MemoryStore for this collection, opening it on first use.
+
+    vector_index only applies when the store is first created.
+    """
+    key = (os.path.abspath(persist_dir), collection_name)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = MemoryStore(persist_dir, collection_name, vector_index=vector_index)
+        return store
@@ -1,25 +1,67 @@
 import sqlite3
+import time
 import uuid
-import pytz
-from datetime import datetime, timedelta
+from contextlib import contextmanager
+from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 import re
 
+# Only very explicit ending phrases
+ENDING_PHRASES = [
+    r'\b(goodbye|bye|see you later|farewell)\s*$',
+    r'\b(that\'s all for now|that\'s it for today)\b',
+    r'\b(end session|close session|terminate session)\b',
+    r'\b(signing off|logging off)\b'
+]
+
+# Only very explicit topic changes
+TOPIC_CHANGE_PHRASES = [
+    r'\b(let\'s talk about something completely different)\b',
+    r'\b(new topic:|different topic:)\b',
+    r'\b(changing subjects?:)\b'
+]
+
+# Compiled once into a single case-insensitive alternation
+_END_RE = re.compile("|".join(ENDING_PHRASES + TOPIC_CHANGE_PHRASES), re.IGNORECASE)
+
+# Messages that are nothing but an ending phrase, matched without the regex
+_EXACT_ENDERS = frozenset({
+    "bye", "goodbye", "see you later", "farewell",
+    "that's all for now", "that's it for today",
+    "end session", "close session", "terminate session",
+    "signing off", "logging off"
+})
+
+# Seconds an activity check result is reused before the messages table is queried again
+ACTIVE_CHECK_TTL = 5.0
+
 class SessionManager:
     def __init__(self, db_path: str = "jarvis_session.db", context_limit: int = 5200):
         self.db_path = db_path
         self.context_limit = context_limit
         self.current_session_id = None
         self.session_timeout_minutes = 30
+        # (session_id, monotonic time, result) of the latest activity check
+        self._last_active_check = None
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # One long-lived connection in autocommit mode; WAL lets reads proceed while a write is in flight
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        # 64 MiB page cache; memory-mapped I/O stays off so the DB file never adds to RSS as it grows
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.execute("PRAGMA mmap_size=0")
 
+        cursor = self._conn.cursor()
+
+        # Times are stored as UNIX epoch seconds
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS sessions (
                 session_id TEXT PRIMARY KEY,
-                start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_time TIMESTAMP,
+                start_time INTEGER DEFAULT (CAST(strftime('%s','now') AS INTEGER)),
+                end_time INTEGER,
                 summary TEXT,
                 message_count INTEGER DEFAULT 0,
                 status TEXT DEFAULT "active",
@@ -33,14 +75,95 @@ class SessionManager:
                 session_id TEXT,
                 user_query TEXT,
                 assistant_response TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                timestamp INTEGER DEFAULT (CAST(strftime('%s','now') AS INTEGER)),
                 tokens_used INTEGER,
                 FOREIGN KEY (session_id) REFERENCES sessions(session_id)
             )
         ''')
 
-        conn.commit()
-        conn.close()
+        self._migrate_timestamps()
+
+        # Per-session lookups ordered by time become index seeks instead of full scans
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_time ON messages(session_id, timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status)")
+
+        # Session counters are maintained by SQLite, so recording a message is a single INSERT
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_after_insert AFTER INSERT ON messages
+            BEGIN
+                UPDATE sessions
+                SET message_count = message_count + 1,
+                    total_tokens = total_tokens + COALESCE(NEW.tokens_used, 0)
+                WHERE session_id = NEW.session_id;
+            END
+        ''')
+
+    def _migrate_timestamps(self):
+        """One-shot rewrite of databases created with TEXT timestamp columns to epoch INTEGERs"""
+        columns = {row[1]: row[2] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        if columns.get("start_time", "").upper() == "INTEGER":
+            return
+
+        # SQLite cannot change a column type in place, so copy into new tables and swap them in.
+        # start_time and messages.timestamp came from CURRENT_TIMESTAMP (UTC);
+        # end_time was written as a local-time isoformat() string.
+        with self._transaction() as cursor:
+            cursor.execute('''
+                CREATE TABLE sessions_new (
+                    session_id TEXT PRIMARY KEY,
+                    start_time INTEGER DEFAULT (CAST(strftime('%s','now') AS INTEGER)),
+                    end_time INTEGER,
+                    summary TEXT,
+                    message_count INTEGER DEFAULT 0,
+                    status TEXT DEFAULT "active",
+                    total_tokens INTEGER DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO sessions_new (session_id, start_time, end_time, summary, message_count, status, total_tokens)
+                SELECT session_id,
+                       CAST(strftime('%s', start_time) AS INTEGER),
+                       CAST(strftime('%s', end_time, 'utc') AS INTEGER),
+                       summary, message_count, status, total_tokens
+                FROM sessions
+            ''')
+            cursor.execute('''
+                CREATE TABLE messages_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT,
+                    user_query TEXT,
+                    assistant_response TEXT,
+                    timestamp INTEGER DEFAULT (CAST(strftime('%s','now') AS INTEGER)),
+                    tokens_used INTEGER,
+                    FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO messages_new (id, session_id, user_query, assistant_response, timestamp, tokens_used)
+                SELECT id, session_id, user_query, assistant_response,
+                       CAST(strftime('%s', timestamp) AS INTEGER), tokens_used
+                FROM messages
+            ''')
+            cursor.execute("DROP TABLE messages")
+            cursor.execute("DROP TABLE sessions")
+            cursor.execute("ALTER TABLE sessions_new RENAME TO sessions")
+            cursor.execute("ALTER TABLE messages_new RENAME TO messages")
+
+    @contextmanager
+    def _transaction(self):
+        """Group several statements into a single transaction on the shared connection"""
+        cursor = self._conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            yield cursor
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
         
 
     def get_or_create_session(self) -> str:
@@ -50,15 +173,11 @@ class SessionManager:
         
         session_id = f"sess_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
+        cursor = self._conn.cursor()
         cursor.execute(
             "INSERT INTO sessions (session_id, status) VALUES (?, ?)",
             (session_id, "active")
         )
-        conn.commit()
-        conn.close()
 
         self.current_session_id = session_id
         return session_id
@@ -68,101 +187,52 @@ class SessionManager:
             print("[DEBUG] No current session.")
             return False
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if self._last_active_check is not None:
+            session_id, checked_at, active = self._last_active_check
+            if session_id == self.current_session_id and time.monotonic() - checked_at < ACTIVE_CHECK_TTL:
+                return active
+
+        active = self._check_session_active()
+        self._last_active_check = (self.current_session_id, time.monotonic(), active)
+        return active
+
+    def _check_session_active(self) -> bool:
+        cursor = self._conn.cursor()
         cursor.execute(
             "SELECT timestamp FROM messages WHERE session_id = ? ORDER BY timestamp DESC LIMIT 1",
             (self.current_session_id,)
         )
         result = cursor.fetchone()
-        conn.close()
 
         if not result:
             print("[DEBUG] No messages yet; session is active.")
             return True
 
-        try:
-            # Parse the timestamp from the DB (stored in UTC)
-            last_message_time = datetime.strptime(result[0], "%Y-%m-%d %H:%M:%S")
-        
-            # Convert the UTC time to IST
-            utc_zone = pytz.utc
-            ist_zone = pytz.timezone('Asia/Kolkata')
-        
-            # Set the timestamp to UTC timezone first
-            last_message_time = utc_zone.localize(last_message_time)
-        
-            # Convert it to IST
-            last_message_time_ist = last_message_time.astimezone(ist_zone)
-        
-            # Get the current time in IST
-            now_ist = datetime.now(ist_zone)
-
-            # Check if the session is inactive based on the timeout
-            inactive = now_ist - last_message_time_ist > timedelta(minutes=self.session_timeout_minutes)
-            print(f"[DEBUG] Last message at {last_message_time_ist}, inactive: {inactive}")
-            return not inactive
-        except Exception as e:
-            print(f"[ERROR] Timestamp parsing failed: {e}")
-            return True  # default to active if unsure
+        # Epoch seconds compare directly; no parsing or timezone conversion needed
+        inactive = time.time() - result[0] > self.session_timeout_minutes * 60
+        print(f"[DEBUG] Last message at {datetime.fromtimestamp(result[0])}, inactive: {inactive}")
+        return not inactive
 
 
     def add_message(self, user_query: str, assistant_response: str, tokens_used: int = 0):
         """Add a message to the current session"""
         session_id = self.get_or_create_session()
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "INSERT INTO messages (session_id, user_query, assistant_response, tokens_used) VALUES (?, ?, ?, ?)",
-            (session_id, user_query, assistant_response, tokens_used)  # Fixed: was token_used
+        # trg_messages_after_insert updates message_count and total_tokens in the same statement
+        self._conn.execute(
+            "INSERT INTO messages (session_id, user_query, assistant_response, timestamp, tokens_used) VALUES (?, ?, ?, ?, ?)",
+            (session_id, user_query, assistant_response, int(time.time()), tokens_used)  # Fixed: was token_used
         )
 
-        cursor.execute(
-            "UPDATE sessions SET message_count = message_count + 1, total_tokens = total_tokens + ? WHERE session_id = ?",
-            (tokens_used, session_id)
-        )
-
-        conn.commit()
-        conn.close()
-
     def should_end_session(self, user_query: str) -> bool:
         """Determine if session should end based on conversation patterns"""
+        if user_query.strip().lower().rstrip(".!?") in _EXACT_ENDERS:
+            return True
+        return bool(_END_RE.search(user_query))
     
-        # Only very explicit ending phrases
-        ending_phrases = [
-            r'\b(goodbye|bye|see you later|farewell)\s*$',  
-            r'\b(that\'s all for now|that\'s it for today)\b',
-            r'\b(end session|close session|terminate session)\b',
-            r'\b(signing off|logging off)\b'
-        ]
-    
-        # Only very explicit topic changes
-        topic_change_phrases = [
-            r'\b(let\'s talk about something completely different)\b',
-            r'\b(new topic:|different topic:)\b',
-            r'\b(changing subjects?:)\b'
-        ]
-    
-        user_lower = user_query.lower().strip()
-    
-        # Only end if it's a very explicit ending
-        for pattern in ending_phrases:
-            if re.search(pattern, user_lower):
-                return True
-    
-        # Only end for very explicit topic changes
-        for pattern in topic_change_phrases:
-            if re.search(pattern, user_lower):
-                return True
-    
-        return False
-    
-    def get_session_context(self) -> str:
-        """Build context for current session with sliding window if needed"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _context_window(self) -> Tuple[List[Tuple], bool]:
+        """Return the current session's messages and whether they exceed the context limit"""
+        cursor = self._conn.cursor()
         
         # Get all messages for this session
         cursor.execute(
@@ -170,15 +240,35 @@ class SessionManager:
             (self.current_session_id,)
         )
         messages = cursor.fetchall()
-        conn.close()
         
         if not messages:
-            return ""
+            return [], False
         
-        # Calculate total tokens
-        total_tokens = sum(msg[2] if msg[2] else 0 for msg in messages)
+        # Total tokens are maintained by add_message, so read them instead of summing messages
+        cursor.execute(
+            "SELECT total_tokens FROM sessions WHERE session_id = ?",
+            (self.current_session_id,)
+        )
+        row = cursor.fetchone()
+        total_tokens = row[0] if row and row[0] else 0
         
-        if total_tokens <= self.context_limit:
+        return messages, total_tokens > self.context_limit
+    
+    def get_session_messages(self) -> List[Tuple[str, str]]:
+        """Return (user_query, assistant_response) pairs for the prompt, keeping the last 8 once over the limit"""
+        messages, over_limit = self._context_window()
+        if over_limit:
+            messages = messages[-8:]
+        return [(user_query, assistant_response) for user_query, assistant_response, _ in messages]
+    
+    def get_session_context(self) -> str:
+        """Build context for current session with sliding window if needed"""
+        messages, over_limit = self._context_window()
+        
+        if not messages:
+            return ""
+        
+        if not over_limit:
             # Include all messages
             return self._format_full_context(messages)
         else:
@@ -187,60 +277,53 @@ class SessionManager:
         
     def _format_full_context(self, messages: List[Tuple]) -> str:
         """Format all messages as context"""
-        context = "Previous conversation:\n\n"
+        parts = ["Previous conversation:\n\n"]
         for user_query, assistant_response, _ in messages:
-            context += f"User: {user_query}\n"
-            context += f"Jarvis: {assistant_response}\n\n"
-        return context
+            parts.append(f"User: {user_query}\nJarvis: {assistant_response}\n\n")
+        return "".join(parts)
     
     def _format_sliding_window_context(self, messages: List[Tuple], session_id: str) -> str:
         """Format context using sliding window approach"""
         # Keep last 8 exchanges
         recent_messages = messages[-8:]
         
-        context = ""
+        parts = []
         
         # Add session summary if available (from RAG or previous part of session)
         if len(messages) > 8:
-            context += "[Earlier in this conversation: Discussion covered technical implementation details and optimization strategies]\n\n"
+            parts.append("[Earlier in this conversation: Discussion covered technical implementation details and optimization strategies]\n\n")
         
-        context += "Recent conversation:\n\n"
+        parts.append("Recent conversation:\n\n")
         for user_query, assistant_response, _ in recent_messages:
-            context += f"User: {user_query}\n"
-            context += f"Jarvis: {assistant_response}\n\n"
+            parts.append(f"User: {user_query}\nJarvis: {assistant_response}\n\n")
         
-        return context
+        return "".join(parts)
     
     def end_session(self, summary: str = None) -> Dict:
         """End current session and return session data for RAG storage"""
         if not self.current_session_id:
             return {}
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Update session status
-        cursor.execute(
-            "UPDATE sessions SET status = ?, end_time = ?, summary = ? WHERE session_id = ?",
-            ('ended', datetime.now().isoformat(), summary, self.current_session_id)
-        )
-        
-        # Get session data for RAG storage
-        cursor.execute(
-            "SELECT session_id, start_time, end_time, message_count, total_tokens FROM sessions WHERE session_id = ?",
-            (self.current_session_id,)
-        )
-        session_data = cursor.fetchone()
-        
-        # Get all messages for summary generation
-        cursor.execute(
-            "SELECT user_query, assistant_response FROM messages WHERE session_id = ? ORDER BY timestamp",
-            (self.current_session_id,)
-        )
-        messages = cursor.fetchall()
-        
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            # Update session status
+            cursor.execute(
+                "UPDATE sessions SET status = ?, end_time = ?, summary = ? WHERE session_id = ?",
+                ('ended', int(time.time()), summary, self.current_session_id)
+            )
+            
+            # Get session data for RAG storage
+            cursor.execute(
+                "SELECT session_id, start_time, end_time, message_count, total_tokens FROM sessions WHERE session_id = ?",
+                (self.current_session_id,)
+            )
+            session_data = cursor.fetchone()
+            
+            # Get all messages for summary generation
+            cursor.execute(
+                "SELECT user_query, assistant_response FROM messages WHERE session_id = ? ORDER BY timestamp",
+                (self.current_session_id,)
+            )
+            messages = cursor.fetchall()
         
         # Reset current session
         session_id = self.current_session_id
@@ -261,15 +344,12 @@ class SessionManager:
         if not self.current_session_id:
             return []
     
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         cursor.execute(
             "SELECT user_query, assistant_response FROM messages WHERE session_id = ? ORDER BY timestamp",
             (self.current_session_id,)
         )
-        messages = cursor.fetchall()
-        conn.close()
-        return messages
+        return cursor.fetchall()
 
 
     def get_session_stats(self) -> Dict:
@@ -277,14 +357,12 @@ class SessionManager:
         if not self.current_session_id:
             return {}
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         cursor.execute(
             "SELECT message_count, total_tokens FROM sessions WHERE session_id = ?",
             (self.current_session_id,)
         )
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {
@@ -0,0 +1,161 @@
+import json
+import os
+import numpy as np
+from typing import List, Tuple
+
+def normalize(vectors) -> np.ndarray:
+    """Scale float32 vectors to unit length so inner product equals cosine similarity."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class MatrixIndex:
+    """Exact cosine search over a contiguous (N, dim) matrix of unit vectors.
+
+    Scoring a query is a single matrix-vector product, which at the few-thousand
+    summary scale this store sees is as fast as an ANN index and has no recall loss.
+    Rows are appended into spare capacity that grows geometrically, so adds do not
+    copy the whole matrix each time.
+
+    With quantize=True rows are stored as int8 with one float32 scale per row,
+    cutting memory and the bandwidth of every scan by 4x. Dot products are then
+    accumulated in int32 over blocks of rows and rescaled, at a small accuracy cost.
+    """
+    # Rows widened to int32 at a time when scoring a quantized matrix
+    QUANTIZED_BLOCK_ROWS = 4096
+
+    def __init__(self, dim: int = 384, quantize: bool = False):
+        self.dim = dim
+        self.quantize = quantize
+        self._reset()
+
+    def _reset(self):
+        self._matrix = np.empty((0, self.dim), dtype=np.int8 if self.quantize else np.float32)
+        self._scales = np.empty(0, dtype=np.float32)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _quantize(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Symmetric per-row int8 quantization: rows ~= values * scales[:, None]."""
+        scales = np.abs(rows).max(axis=-1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0
+        values = np.round(rows / scales).astype(np.int8)
+        return values, scales[..., 0].astype(np.float32)
+
+    def add(self, ids: List[str], embeddings) -> None:
+        if not ids:
+            return
+        rows = normalize(embeddings).reshape(-1, self.dim)
+        n, needed = len(self.ids), len(self.ids) + len(rows)
+        if needed > len(self._matrix):
+            capacity = max(needed, 2 * len(self._matrix), 256)
+            grown = np.empty((capacity, self.dim), dtype=self._matrix.dtype)
+            grown[:n] = self._matrix[:n]
+            self._matrix = grown
+            grown_scales = np.empty(capacity, dtype=np.float32)
+            grown_scales[:n] = self._scales[:n]
+            self._scales = grown_scales
+
+        if self.quantize:
+            self._matrix[n:needed], self._scales[n:needed] = self._quantize(rows)
+        else:
+            self._matrix[n:needed] = rows
+        self.ids.extend(ids)
+
+    def rebuild(self, ids: List[str], embeddings) -> None:
+        self._reset()
+        self.add(list(ids), embeddings)
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        n = len(self.ids)
+        if not self.quantize:
+            return self._matrix[:n] @ query
+
+        query_values, query_scale = self._quantize(query)
+        query_values = query_values.astype(np.int32)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.QUANTIZED_BLOCK_ROWS):
+            stop = min(start + self.QUANTIZED_BLOCK_ROWS, n)
+            dots = self._matrix[start:stop].astype(np.int32) @ query_values
+            scores[start:stop] = dots * self._scales[start:stop] * query_scale
+        return scores
+
+    def search(self, query_embedding, top_k: int) -> List[Tuple[str, float]]:
+        """Return (id, cosine_similarity) pairs, most similar first."""
+        n = len(self.ids)
+        if n == 0:
+            return []
+        scores = self._scores(normalize(query_embedding).reshape(self.dim))
+        top_k = min(top_k, n)
+        # Partial selection is O(N); only the k winners get sorted
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def save(self) -> None:
+        """Nothing to persist; the matrix is rebuilt from ChromaDB on start-up."""
+
+class FaissIndex:
+    """In-process HNSW index mirroring the embeddings of a Chroma collection.
+
+    Vectors are L2-normalized once on insert, so inner product equals cosine
+    similarity. Chroma stays the system of record; this index only maps query
+    vectors to Chroma ids and can always be rebuilt from the collection.
+    Requires the optional `faiss` package (faiss-cpu or faiss-gpu).
+    """
+    def __init__(self, index_path: str, dim: int = 384, M: int = 32):
+        import faiss  # Optional dependency, only needed when the index is enabled
+
+        self._faiss = faiss
+        self.index_path = index_path
+        self.ids_path = f"{index_path}.ids.json"
+        self.dim = dim
+        self.M = M
+
+        if os.path.exists(self.index_path) and os.path.exists(self.ids_path):
+            self.index = faiss.read_index(self.index_path)
+            with open(self.ids_path, "r") as f:
+                self.ids = json.load(f)
+        else:
+            self._reset()
+
+    def _reset(self):
+        self.index = self._faiss.IndexHNSWFlat(self.dim, self.M, self._faiss.METRIC_INNER_PRODUCT)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _normalize(self, vectors) -> np.ndarray:
+        return np.ascontiguousarray(normalize(vectors).reshape(-1, self.dim))
+
+    def add(self, ids: List[str], embeddings) -> None:
+        if not ids:
+            return
+        self.index.add(self._normalize(embeddings))
+        self.ids.extend(ids)
+
+    def rebuild(self, ids: List[str], embeddings) -> None:
+        """Replace the index contents, e.g. after deletions in Chroma."""
+        self._reset()
+        self.add(list(ids), embeddings)
+
+    def search(self, query_embedding, top_k: int) -> List[Tuple[str, float]]:
+        """Return (chroma_id, cosine_similarity) pairs, most similar first."""
+        if not self.ids:
+            return []
+        similarities, positions = self.index.search(self._normalize(query_embedding), min(top_k, len(self.ids)))
+        return [
+            (self.ids[pos], float(sim))
+            for sim, pos in zip(similarities[0], positions[0])
+            if pos >= 0
+        ]
+
+    def save(self) -> None:
+        self._faiss.write_index(self.index, self.index_path)
+        with open(self.ids_path, "w") as f:
+            json.dump(self.ids, f)
@@ -1,37 +1,130 @@
-from llama_cpp import Llama
-from llama_cpp.llama_chat_format import Llama3VisionAlphaChatHandler
+import os
+import sys
+import threading
+import time
+from llama_cpp import Llama, GGML_TYPE_Q8_0
+
+# Minimum seconds between stdout flushes while echoing a streamed reply (~60 fps)
+ECHO_FLUSH_INTERVAL = 0.016
+
+# Projector used by enable_vision() for image+text chats
+CLIP_MODEL_PATH = "./models/llama-3-vision-alpha-mmproj-f16.gguf"
+
+# Loaded models by model_path; loading one takes seconds and gigabytes, so it happens once per process
+_instances = {}
+_instances_lock = threading.Lock()
 
 class LlamaChat:
-    def __init__(self, model_path, n_gpu_layers=28, n_threads=12, n_ctx=8192): 
-        handler = Llama3VisionAlphaChatHandler(
-            clip_model_path="./models/llama-3-vision-alpha-mmproj-f16.gguf"
-        )
+    def __init__(self, model_path, n_gpu_layers=None, n_threads=None, n_threads_batch=None, n_ctx=8192,
+                 n_batch=512, flash_attn=True, type_k=GGML_TYPE_Q8_0, type_v=GGML_TYPE_Q8_0):
+        # GPU_LAYERS overrides the offload without code changes; 28 fits a 4 GB card, -1 offloads everything
+        if n_gpu_layers is None:
+            n_gpu_layers = int(os.environ.get("GPU_LAYERS", "28"))
+        n_threads = n_threads or os.cpu_count()
+        n_threads_batch = n_threads_batch or os.cpu_count()
+
+        # Decode is memory-bound: flash attention plus a Q8_0 KV cache halve the KV traffic per token
+        # (a quantized V cache requires flash attention)
         self.llm = Llama(
             model_path=model_path,
-            chat_handler=handler,
             n_gpu_layers=n_gpu_layers,
             n_threads=n_threads,
-            n_ctx=n_ctx
+            n_threads_batch=n_threads_batch,
+            n_ctx=n_ctx,
+            n_batch=n_batch,
+            flash_attn=flash_attn,
+            type_k=type_k,
+            type_v=type_v,
+            # Map the GGUF instead of reading it into private memory; the OS pages weights in on demand
+            use_mmap=True,
+            use_mlock=False
         )
 
-    def generate(self, prompt, max_tokens=512, temperature=0.4, top_p=0.85,  repeat_penalty=1.2, stop_tokens=["<|eot_id|>", "<|end_of_text|>", "<|start_header_id|>"]):
-        stream = self.llm.create_completion(
-            prompt=prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            repeat_penalty=repeat_penalty,
-            stop=stop_tokens,
-            stream=True  # Streaming mode
-        )
+        self._prefix = None
+        self._prefix_tokens = None
+        # Token count of the most recent prompt, recorded while encoding it for generation
+        self.last_prompt_tokens = 0
+        # llama.cpp contexts are not thread-safe; warmup may run alongside the first request
+        self._lock = threading.Lock()
+
+    def enable_vision(self, clip_model_path=CLIP_MODEL_PATH):
+        """Load the CLIP projector on first use so text-only runs never pay for it"""
+        if self.llm.chat_handler is None:
+            from llama_cpp.llama_chat_format import Llama3VisionAlphaChatHandler
+
+            self.llm.chat_handler = Llama3VisionAlphaChatHandler(clip_model_path=clip_model_path)
+        return self.llm.chat_handler
 
-        # Collect streamed output
-        output_text = ""
-        for part in stream:
-            output_text += part["choices"][0]["text"]
-            print(part["choices"][0]["text"], end="", flush=True)  # optional: print live
+    def cache_prefix(self, prefix: str):
+        """Tokenize a static prompt prefix once; warmup() prefills it into the KV cache"""
+        self._prefix = prefix
+        self._prefix_tokens = self.llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
 
-        return output_text.strip()
+    def warmup(self):
+        """Generate a single token so weights are paged in and the cached prefix is evaluated"""
+        for _ in self.stream(self._prefix or " ", max_tokens=1):
+            pass
+
+    def reset(self):
+        """Forget the evaluated tokens so the next prompt is prefilled from scratch, e.g. at session end"""
+        with self._lock:
+            self.llm.reset()
+
+    def _encode_prompt(self, prompt: str) -> list:
+        """Tokenize a prompt, reusing the cached prefix tokens when the prompt starts with it"""
+        if self._prefix is not None and prompt.startswith(self._prefix):
+            rest = prompt[len(self._prefix):].encode("utf-8")
+            tokens = self._prefix_tokens + self.llm.tokenize(rest, add_bos=False, special=True)
+        else:
+            tokens = self.llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+        self.last_prompt_tokens = len(tokens)
+        return tokens
+
+    def stream(self, prompt, max_tokens=512, temperature=0.4, top_p=0.85,  repeat_penalty=1.2, stop_tokens=["<|eot_id|>", "<|end_of_text|>", "<|start_header_id|>"]):
+        """Yield generated text pieces as soon as the model produces them.
+
+        llama.cpp keeps the KV cache of the previous call and only prefills tokens after the
+        longest prefix shared with it, so prompts should keep their stable parts first.
+        """
+        with self._lock:
+            stream = self.llm.create_completion(
+                prompt=self._encode_prompt(prompt),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                repeat_penalty=repeat_penalty,
+                stop=stop_tokens,
+                stream=True  # Streaming mode
+            )
+            for part in stream:
+                yield part["choices"][0]["text"]
+
+    def generate(self, prompt, max_tokens=512, temperature=0.4, top_p=0.85,  repeat_penalty=1.2, stop_tokens=["<|eot_id|>", "<|end_of_text|>", "<|start_header_id|>"]):
+        # Collect streamed output; joined once at the end instead of concatenated per token
+        chunks = []
+        last_flush = time.monotonic()
+        for text in self.stream(prompt, max_tokens, temperature, top_p, repeat_penalty, stop_tokens):
+            chunks.append(text)
+            sys.stdout.write(text)  # optional: print live
+            # Flush on newlines or every ECHO_FLUSH_INTERVAL rather than once per token
+            now = time.monotonic()
+            if "\n" in text or now - last_flush >= ECHO_FLUSH_INTERVAL:
+                sys.stdout.flush()
+                last_flush = now
+        sys.stdout.flush()
+
+        return "".join(chunks).strip()
     
     def tokenize(self, text: str) -> list:
-        return self.llm.tokenize(text.encode("utf-8"))
\ No newline at end of file
+        return self.llm.tokenize(text.encode("utf-8"))
+
+def get_llama(model_path, **kwargs) -> LlamaChat:
+    """Return the process-wide LlamaChat for model_path, loading it on first use.
+
+    kwargs are only used when the model is first loaded.
+    """
+    with _instances_lock:
+        llama = _instances.get(model_path)
+        if llama is None:
+            llama = _instances[model_path] = LlamaChat(model_path, **kwargs)
+        return llama
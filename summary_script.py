@@ -1,7 +1,7 @@
-from memory.memory_store import MemoryStore
+from memory.memory_store import get_memory_store
 
 def print_all_session_summaries():
-    memory = MemoryStore()
+    memory = get_memory_store()
 
     try:
         results = memory.collection.get(
@@ -1,18 +1,26 @@
-import json
+import orjson
+import os
 from datetime import datetime
 
-def load_sessions(file_path="chat_log.json"):
-    with open(file_path, "r") as f:
-        data = json.load(f)
+def _read_log_entries(file_path):
+    """Yield log entries from a JSON Lines chat log, one line at a time"""
+    with open(file_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+def iter_sessions(file_path="chat_log.jsonl"):
+    """Yield sessions one at a time while streaming the log, so only the current session is held in memory"""
+    if not os.path.exists(file_path):
+        return
 
-    sessions = []
     current_session = []
-    for entry in data:
+    for entry in _read_log_entries(file_path):
         if entry.get("event") == "session_start":
             current_session = [{"type":"event","event":"start", "time": entry["time"]}]
         elif entry.get("event") == "session_end":
             current_session.append({"type":"event", "event":"end", "time": entry["time"]})
-            sessions.append(current_session)
+            yield current_session
         else:
             current_session.append({
                 "type":"message",
@@ -20,7 +28,10 @@ def load_sessions(file_path="chat_log.json"):
                 "assistant": entry["assistant"],
                 "time": entry["time"]
             })
-    return sessions
+
+def load_sessions(file_path="chat_log.jsonl"):
+    return list(iter_sessions(file_path))
 
 def get_session_summaries(sessions):
-    return [f"Chat on {datetime.strptime(session[0]['time'], '%Y-%m-%d %H:%M:%S').strftime('%b %d, %Y %I:%M %p')}" for session in sessions]
\ No newline at end of file
+    # Log times are "YYYY-MM-DD HH:MM:SS", which the C-implemented fromisoformat parses directly
+    return [f"Chat on {datetime.fromisoformat(session[0]['time']):%b %d, %Y %I:%M %p}" for session in sessions]
\ No newline at end of file
@@ -0,0 +1,5 @@
+import xxhash
+
+def content_id(text: str) -> int:
+    """Stable 63-bit id of a document's text (fits signed 64-bit Chroma/Elasticsearch fields)"""
+    return xxhash.xxh3_64_intdigest(text.encode("utf-8")) >> 1
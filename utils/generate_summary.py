@@ -2,9 +2,10 @@ def generate_session_summary(messages: list, llama_instance) -> str:
     """Use LLM to generate intelligent session summary"""
     if not messages:
         return "Empty session"
-    conversation = ""
-    for user_query, assistant_response in messages:
-        conversation += f"User: {user_query}\nJARVIS: {assistant_response}\n\n"
+    conversation = "".join(
+        f"User: {user_query}\nJARVIS: {assistant_response}\n\n"
+        for user_query, assistant_response in messages
+    )
     summary_prompt = f"""
 You are JARVIS, an AI assistant. You are tasked with writing a concise, factual summary of the following conversation.
 ONLY return the summary. Be neutral and strictly factual. No imaginary context. No speculative language.
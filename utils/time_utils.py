@@ -1,7 +1,9 @@
 import time
+from functools import lru_cache
 
-def get_time_based_greeting():
-    current_hour = time.localtime().tm_hour
+@lru_cache(maxsize=1)
+def _greeting_for_minute(minute_bucket):
+    current_hour = time.localtime(minute_bucket * 60).tm_hour
     if 5 <= current_hour < 12:
         return "Good morning"
     elif 12 <= current_hour < 17:
@@ -10,3 +12,7 @@ def get_time_based_greeting():
         return "Good evening"
     else:
         return "Hello"
+
+def get_time_based_greeting():
+    # The greeting can only change on a minute boundary, so compute it once per minute
+    return _greeting_for_minute(int(time.time() // 60))
@@ -1,10 +1,12 @@
 import streamlit as st
 import time
 
-def type_response(response, delay=0.02):
+# Characters revealed per front-end update
+TYPE_CHUNK_CHARS = 8
+
+def type_response(response, delay=0.02, chunk_size=TYPE_CHUNK_CHARS):
     placeholder = st.empty()
-    displayed_text = ""
-    for char in response:
-        displayed_text += char
-        placeholder.markdown(displayed_text)
-        time.sleep(delay)
\ No newline at end of file
+    # Each markdown() call is a round-trip to the browser, so reveal several characters at a time
+    for end in range(chunk_size, len(response) + chunk_size, chunk_size):
+        placeholder.markdown(response[:end])
+        time.sleep(delay * chunk_size)